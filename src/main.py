@@ -5,37 +5,40 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import os
 import shutil
 import sys
 from typing import Optional
 
-try:
-    import readline  # type: ignore
-except Exception:  # pragma: no cover - fallback when readline unavailable
-    readline = None
-
-READLINE_ACTIVE = bool(readline)
+# readline is imported on first interactive use (see setup_readline) so piped
+# and scripted sessions don't pay for loading it. READLINE_ACTIVE is None until
+# that import has been attempted, then records whether it succeeded.
+readline = None
+READLINE_ACTIVE: Optional[bool] = None
 
 PROMPT = "pysh> "
 CONTINUATION_PROMPT = "... "
 
-from ops import CommandRunner, ShellSession, execute_line  # local module in the same folder
+from ops import ShellSession, execute_line  # local module in the same folder
 
 # List of known POSIX-compliant shells
 POSIX_SHELLS = [
     "bash", "zsh", "dash", "sh", "ksh", "mksh", "pdksh", "ash", "busybox",
     "yash", "loksh", "oksh", "posh", "bosh"
 ]
+# Set view for membership tests; POSIX_SHELLS keeps the search order for find_posix_shell
+POSIX_SHELLS_SET = frozenset(POSIX_SHELLS)
 
 
+@functools.lru_cache(maxsize=32)
 def is_posix_shell(shell_path: str) -> bool:
     """Check if a shell is POSIX-compliant by checking its basename against known shells."""
     if not shell_path:
         return False
     
     shell_name = os.path.basename(shell_path)
-    return shell_name in POSIX_SHELLS
+    return shell_name in POSIX_SHELLS_SET
 
 
 def find_posix_shell() -> Optional[str]:
@@ -108,28 +111,56 @@ def get_default_shell(force_shell: Optional[str] = None) -> tuple[str, bool]:
     return "/bin/sh", warning_issued
 
 
+def _load_readline():
+    global readline, READLINE_ACTIVE
+    if READLINE_ACTIVE is None:
+        try:
+            import readline as _readline  # type: ignore
+        except Exception:  # pragma: no cover - fallback when readline unavailable
+            READLINE_ACTIVE = False
+            return None
+        readline = _readline
+        READLINE_ACTIVE = True
+    return readline
+
+
 def setup_readline() -> None:
-    if not READLINE_ACTIVE:
+    if READLINE_ACTIVE is False or not sys.stdin.isatty():
+        return
+    if _load_readline() is None:
         return
     try:
         readline.parse_and_bind("set editing-mode emacs")
         readline.parse_and_bind("Control-l: clear-screen")
+        # Installed once; it only acts when _set_indent_prefill left an indent
+        readline.set_pre_input_hook(_prefill_hook)
     except Exception:
         pass
 
 
-def _set_indent_prefill(indent: str) -> None:
-    if not READLINE_ACTIVE or not sys.stdin.isatty():
-        return
+@functools.lru_cache(maxsize=16)
+def _indent(unit: str, level: int) -> str:
+    """Indentation string for a continuation prompt, reused across prompts."""
+    return unit * max(level, 0)
 
-    def hook() -> None:
-        try:
-            readline.insert_text(indent)
-            readline.redisplay()
-        finally:
-            readline.set_pre_input_hook(None)
 
-    readline.set_pre_input_hook(hook)
+# Indent the next input() should start with; consumed by _prefill_hook
+_pending_prefill = ""
+
+
+def _prefill_hook() -> None:
+    global _pending_prefill
+    if _pending_prefill:
+        indent, _pending_prefill = _pending_prefill, ""
+        readline.insert_text(indent)
+        readline.redisplay()
+
+
+def _set_indent_prefill(indent: str) -> None:
+    global _pending_prefill
+    if readline is None or not sys.stdin.isatty():
+        return
+    _pending_prefill = indent
 
 
 def repl(shell_path: Optional[str] = None) -> int:
@@ -137,25 +168,22 @@ def repl(shell_path: Optional[str] = None) -> int:
     session = ShellSession(shell=shell, inherit_env=True)
 
     setup_readline()
-    readline_enabled = READLINE_ACTIVE and sys.stdin.isatty()
+    readline_enabled = readline is not None and sys.stdin.isatty()
 
-    last_runner: Optional[CommandRunner] = None
+    last_exit_code = 0
     while True:
         try:
             if session.in_multi_line:
-                indent_unit = session.get_indent_unit()
-                indent = indent_unit * max(session.current_indent_level, 0)
+                indent = _indent(session.get_indent_unit(), session.current_indent_level)
                 if readline_enabled:
+                    # Pre-fill the indent as editable text so it can be
+                    # backspaced to return to an outer block
                     if indent:
                         _set_indent_prefill(indent)
-                    else:
-                        readline.set_pre_input_hook(None)  # type: ignore[attr-defined]
                     prompt = CONTINUATION_PROMPT
                 else:
                     prompt = CONTINUATION_PROMPT + indent
             else:
-                if readline_enabled:
-                    readline.set_pre_input_hook(None)  # type: ignore[attr-defined]
                 prompt = PROMPT
             # Preserve the line exactly as typed (no strip/rstrip)
             line = input(prompt)
@@ -175,20 +203,13 @@ def repl(shell_path: Optional[str] = None) -> int:
         # Delegate to unified executor which prefers shell commands for preserved names and PATH commands,
         # and falls back to Python only when appropriate per spec.
         try:
-            exit_code = execute_line(line, session)
-            runner = CommandRunner(line=line, shell=shell, env=session.get_env())
-            runner.exit_code = exit_code
-            runner.stdout = None
-            runner.stderr = None
-            last_runner = runner
+            last_exit_code = execute_line(line, session)
         except Exception as e:
             print(f"pysh: parse/exec error: {e}", file=sys.stderr)
-            runner = CommandRunner(line=line, shell=shell, env=session.get_env())
-            runner.exit_code = 1
-            last_runner = runner
+            last_exit_code = 1
 
     # If loop exits via EOF, return the last exit code we saw (default 0).
-    return (last_runner.exit_code if last_runner and last_runner.exit_code is not None else 0)
+    return last_exit_code
 
 
 def parse_args(args=None) -> argparse.Namespace:
@@ -4,27 +4,97 @@ import os
 import subprocess
 import sys
 import ast
+import codecs
+import collections
+import functools
 import shutil
 import io
+import locale
+import re
+import selectors
 from dataclasses import dataclass
 from contextlib import ExitStack, redirect_stdout, redirect_stderr, nullcontext
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Dict, List, Tuple, Any, Sequence, NamedTuple
 import codeop
 
 
 # ---- Token model for parsing (word vs operator) ----
-class Token:
-    def __init__(self, kind: str, value: str, quoting: str = 'unquoted') -> None:
-        # kind in { 'WORD', 'OP' }
-        # quoting in { 'unquoted', 'single', 'double' }
-        self.kind = kind
-        self.value = value
-        self.quoting = quoting
+class Token(NamedTuple):
+    # Immutable so the cached token tuples from _tokenize can be shared safely.
+    # Literal kind/quoting strings are interned, so comparisons hit on identity.
+    kind: str  # 'WORD' or 'OP'
+    value: str
+    quoting: str = 'unquoted'  # 'unquoted', 'single' or 'double'
 
     def __repr__(self) -> str:
         return f"Token({self.kind!r}, {self.value!r}, {self.quoting!r})"
 
 
+def _env_str(value: Any) -> str:
+    try:
+        return str(value)
+    except Exception:
+        return repr(value)
+
+
+class _MirroredVars(dict):
+    """Session variable dict that copies every change into a globals dict.
+
+    exec/eval then use the globals dict as-is instead of refreshing it from
+    the variables before each line. Names the globals dict reserves are never
+    overwritten or removed.
+    """
+
+    _RESERVED = frozenset({"__builtins__", "__pysh_exec_shell"})
+
+    def __init__(self, mirror: Dict[str, Any]) -> None:
+        super().__init__()
+        self._mirror = mirror
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        super().__setitem__(key, value)
+        if key not in self._RESERVED:
+            self._mirror[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        if key not in self._RESERVED:
+            self._mirror.pop(key, None)
+
+    def pop(self, key: str, *default: Any) -> Any:
+        if key in self:
+            value = super().pop(key)
+            if key not in self._RESERVED:
+                self._mirror.pop(key, None)
+            return value
+        return super().pop(key, *default)
+
+    def popitem(self) -> Tuple[str, Any]:
+        key, value = super().popitem()
+        if key not in self._RESERVED:
+            self._mirror.pop(key, None)
+        return key, value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other: Any) -> "_MirroredVars":
+        self.update(other)
+        return self
+
+    def clear(self) -> None:
+        for key in self:
+            if key not in self._RESERVED:
+                self._mirror.pop(key, None)
+        super().clear()
+
+
 class ShellSession:
     """Holds session-wide shell context like environment variables."""
 
@@ -32,9 +102,6 @@ class ShellSession:
         self.shell: str = shell
         # String-only environment used as base for subprocesses
         self.env: Dict[str, str] = dict(os.environ) if inherit_env else {}
-        # Python variable space: holds Python objects defined by the user via assignments
-        # Does not include inherited env by default; env is merged at get_env/expansion time
-        self.py_vars: Dict[str, Any] = {}
         self.background_jobs: List[List[subprocess.Popen]] = []
         # Multi-line Python code accumulation and indentation handling
         self.multi_line_buffer: List[str] = []
@@ -42,17 +109,34 @@ class ShellSession:
         self.command_compiler = codeop.CommandCompiler()
         self.default_indent_unit: str = os.environ.get("PYSH_INDENT", "    ")
         self.current_indent_level: int = 0
+        # (command, PATH) -> resolved executable; only successful lookups are kept
+        self.command_paths: Dict[Tuple[str, str], str] = {}
+        # Globals for Python execution, built once; the shell helper is a bound method
+        # so converted multi-line code can always resolve __pysh_exec_shell.
+        self.exec_globals: Dict[str, Any] = {
+            "__builtins__": __builtins__,
+            "__pysh_exec_shell": self._exec_shell,
+        }
+        # Python variable space: holds Python objects defined by the user via assignments
+        # Does not include inherited env by default; env is merged at get_env/expansion time.
+        # Every change is mirrored into exec_globals, so functions defined in the
+        # session (whose __globals__ it is) see reassigned and removed names.
+        self.py_vars: Dict[str, Any] = _MirroredVars(self.exec_globals)
 
     def get_env(self) -> Dict[str, str]:
         # Merge string env with stringified Python vars; Python vars take precedence
         merged = dict(self.env)
         for k, v in self.py_vars.items():
-            try:
-                merged[k] = str(v)
-            except Exception:
-                merged[k] = repr(v)
+            # Strings (PWD, values set from the shell) are used as-is
+            merged[k] = v if type(v) is str else _env_str(v)
         return merged
 
+    def get_env_value(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        # Same as get_env().get(name, default) without building the merged dict
+        if name in self.py_vars:
+            return _env_str(self.py_vars[name])
+        return self.env.get(name, default)
+
     def get_indent_unit(self) -> str:
         indent_override = self.py_vars.get("__pysh_indent")
         if isinstance(indent_override, str):
@@ -75,13 +159,34 @@ class ShellSession:
         if name in self.py_vars:
             del self.py_vars[name]
 
+    def _exec_shell(self, cmd: str) -> int:
+        """Execute shell command with access to caller's local variables (function parameters)."""
+        # Get the caller's frame (the function calling __pysh_exec_shell)
+        caller_locals = sys._getframe(1).f_locals
+
+        # Temporarily update py_vars with caller's locals (includes function parameters)
+        original_vars = dict(self.py_vars)
+        self.py_vars.update(caller_locals)
+        try:
+            return _pysh_exec_shell_helper(cmd, self)
+        finally:
+            # Keep any new assignments, but bring back names the command removed
+            for k, v in original_vars.items():
+                if k not in self.py_vars:
+                    self.py_vars[k] = v
+
 
 # Commands that are "preserved" and must resolve to system commands when invoked.
-GUARANTEED_COMMANDS: set[str] = {
+GUARANTEED_COMMANDS: frozenset[str] = frozenset({
     'cd', 'ls', 'pwd', 'mkdir', 'rmdir', 'rm', 'cp', 'mv', 'find', 'basename', 'dirname',
     'echo', 'cat', 'head', 'tail', 'wc', 'grep', 'sort', 'uniq', 'cut',
     'date', 'uname', 'ps', 'which', 'env', 'fd', 'rg'
-}
+})
+
+
+# Characters that can change expansion state; everything between them is copied as-is
+_EXPAND_SPECIAL_RE = re.compile(r"""['"\\$]""")
+_VAR_NAME_RE = re.compile(r"\w+")
 
 
 def _expand_vars_in_line(line: str, session: ShellSession, *, force_double: bool = False) -> str:
@@ -93,75 +198,72 @@ def _expand_vars_in_line(line: str, session: ShellSession, *, force_double: bool
     - Backslash escapes next char (so \\$ yields literal $) outside single quotes
     - Undefined vars expand to empty string
     """
+    if '$' not in line:
+        # Quotes and backslashes are passed through untouched, so nothing can change
+        return line
     out: List[str] = []
+    search = _EXPAND_SPECIAL_RE.search
     i = 0
     n = len(line)
-    in_single = False
     in_double = force_double
     while i < n:
-        ch = line[i]
+        m = search(line, i)
+        if m is None:
+            out.append(line[i:])
+            break
+        j = m.start()
+        if j > i:
+            out.append(line[i:j])
+        ch = line[j]
         if ch == "'":
-            in_single = not in_single if not in_double else in_single
-            out.append(ch)
-            i += 1
+            if in_double:
+                out.append(ch)
+                i = j + 1
+                continue
+            # Single-quoted run: copied literally up to and including the closing quote
+            k = line.find("'", j + 1)
+            if k == -1:
+                out.append(line[j:])
+                break
+            out.append(line[j:k + 1])
+            i = k + 1
             continue
         if ch == '"':
-            in_double = not in_double if not in_single else in_double
+            in_double = not in_double
             out.append(ch)
-            i += 1
+            i = j + 1
             continue
-        if ch == '\\' and not in_single:
+        if ch == '\\':
             # For expansion, only consume backslash when escaping a dollar sign.
             # Otherwise, preserve the backslash for the tokenizer to handle.
-            if i + 1 < n and line[i + 1] == '$':
+            if line.startswith('$', j + 1):
                 out.append('$')
-                i += 2
-                continue
+                i = j + 2
             else:
                 out.append('\\')
-                i += 1
+                i = j + 1
+            continue
+        # ch == '$'
+        if line.startswith('{', j + 1):
+            # ${var}; without a closing brace the '$' is literal
+            k = line.find('}', j + 2)
+            if k == -1:
+                out.append('$')
+                i = j + 1
                 continue
-        if ch == '$' and not in_single:
-            # Parse variable name
-            if i + 1 < n and line[i + 1] == '{':
-                # ${var}
-                j = i + 2
-                name_chars: List[str] = []
-                while j < n and line[j] != '}':
-                    name_chars.append(line[j])
-                    j += 1
-                if j < n and line[j] == '}':
-                    var_name = ''.join(name_chars)
-                    val = session.get_var(var_name)
-                    out.append('' if val is None else str(val))
-                    i = j + 1
-                    continue
-                else:
-                    # No closing }, treat literally
-                    out.append('$')
-                    i += 1
-                    continue
-            else:
-                # $var_name
-                j = i + 1
-                if j < n and ((line[j] == '_' or line[j].isalpha())):
-                    name_chars: List[str] = []
-                    while j < n and (line[j] == '_' or line[j].isalnum()):
-                        name_chars.append(line[j])
-                        j += 1
-                    var_name = ''.join(name_chars)
-                    val = session.get_var(var_name)
-                    out.append('' if val is None else str(val))
-                    i = j
-                    continue
-                else:
-                    # Not a valid var expansion ($ followed by non-name)
-                    out.append('$')
-                    i += 1
-                    continue
-        # default
-        out.append(ch)
-        i += 1
+            val = session.get_var(line[j + 2:k])
+            out.append('' if val is None else str(val))
+            i = k + 1
+            continue
+        name_match = _VAR_NAME_RE.match(line, j + 1)
+        if name_match is None or not (line[j + 1] == '_' or line[j + 1].isalpha()):
+            # Not a valid var expansion ($ followed by non-name)
+            out.append('$')
+            i = j + 1
+            continue
+        val = session.get_var(name_match.group())
+        out.append('' if val is None else str(val))
+        i = name_match.end()
     return ''.join(out)
 
 
@@ -172,6 +274,10 @@ def _count_indent_units(line: str, indent_unit: str) -> int:
     if not indent_unit:
         return 0
     unit_len = len(indent_unit)
+    first = indent_unit[0]
+    if indent_unit.count(first) == unit_len:
+        # Uniform units ("    ", "\t"): measure the leading run in one C call
+        return (len(line) - len(line.lstrip(first))) // unit_len
     count = 0
     pos = 0
     while line.startswith(indent_unit, pos):
@@ -190,7 +296,6 @@ def _start_multiline_block(session: ShellSession, first_line: str) -> None:
         session.current_indent_level = indent_count + 1
     else:
         session.current_indent_level = indent_count
-    session.command_compiler = codeop.CommandCompiler()
 
 
 def _append_multiline_line(session: ShellSession, line: str) -> None:
@@ -226,14 +331,10 @@ def _append_multiline_line(session: ShellSession, line: str) -> None:
 
 
 def _expand_word(word: str, quoting: str, session: ShellSession) -> str:
-    # Handle sentinel markers injected during tokenization
-    if word.startswith("\x00S"):
+    if quoting == 'single':
         # Single-quoted: return literally, no expansion
-        return word[2:]
-    force_double = False
-    if word.startswith("\x00D"):
-        force_double = True
-        word = word[2:]
+        return word
+    force_double = quoting == 'double'
     # Expand command substitutions first, then variables
     s = _expand_command_substitutions(word, session, for_python=False)
     s = _expand_vars_in_line(s, session, force_double=force_double)
@@ -243,14 +344,63 @@ def _expand_word(word: str, quoting: str, session: ShellSession) -> str:
     return s
 
 
+@functools.lru_cache(maxsize=512)
+def _compile_cached(source: str, mode: str) -> Any:
+    """Compile Python source once per (source, mode) pair.
+
+    Compilation is a pure function of its input, so repeated lines (loops,
+    history re-runs, tests) reuse the code object instead of re-running the
+    parser and compiler. Errors are not cached and propagate to the caller.
+    """
+    return compile(source, '<pysh>', mode)
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_cached(source: str, mode: str) -> Optional[ast.AST]:
+    """Parse Python source once per (source, mode); None if it is not valid Python.
+
+    Shell lines are probed with the Python parser on every run, so failures are
+    cached as well. The returned trees are shared and must not be mutated.
+    """
+    try:
+        return ast.parse(source, mode=mode)
+    except SyntaxError:
+        return None
+
+
+def _target_names(target: ast.AST, *, strict: bool) -> Optional[List[str]]:
+    """Names bound by an assignment target, in source order.
+
+    Walks names nested in tuples/lists. Any other node (attribute, subscript,
+    starred) makes the result None when strict, and is skipped otherwise.
+    """
+    names: List[str] = []
+    stack = [target]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Name):
+            names.append(node.id)
+        elif isinstance(node, (ast.Tuple, ast.List)):
+            stack.extend(reversed(node.elts))
+        elif strict:
+            return None
+    return names
+
+
+# Prefix of an assignment to plain names: `x =`, `a, *b =`, `(a, b) = ...`; '==' excluded
+_ASSIGN_PROBE_RE = re.compile(r"[\s(\[*]*[^\W\d][\w\s,()\[\]*]*=(?!=)")
+
+
 def _try_python_assignment(line: str, session: ShellSession) -> Optional[int]:
     """Detect and execute simple Python assignments like: x = 10, a, b = (1, 2).
 
     Returns an int exit code (0/1) if handled, else None if the line is not an assignment.
     """
-    try:
-        tree = ast.parse(line, mode='exec')
-    except SyntaxError:
+    if _ASSIGN_PROBE_RE.match(line) is None:
+        # Cannot be a plain-name assignment; spare the parser (and its cache)
+        return None
+    tree = _parse_cached(line, 'exec')
+    if tree is None:
         return None
     # Only handle a single Assign statement
     if not tree.body or len(tree.body) != 1:
@@ -259,23 +409,13 @@ def _try_python_assignment(line: str, session: ShellSession) -> Optional[int]:
     if not isinstance(node, ast.Assign):
         return None
 
-    # Collect target names
+    # Collect target names; attribute/subscript/starred targets are left to try_python
     names: List[str] = []
-    def collect(t: ast.AST) -> None:
-        if isinstance(t, ast.Name):
-            names.append(t.id)
-        elif isinstance(t, (ast.Tuple, ast.List)):
-            for elt in t.elts:
-                collect(elt)
-        else:
-            # Unsupported complex target like attribute or subscription
-            raise SyntaxError("unsupported assignment target")
-
-    try:
-        for tgt in node.targets:
-            collect(tgt)
-    except SyntaxError:
-        return None
+    for tgt in node.targets:
+        tgt_names = _target_names(tgt, strict=True)
+        if tgt_names is None:
+            return None
+        names.extend(tgt_names)
 
     # Disallow assigning to names that are preserved commands
     for nm in names:
@@ -284,17 +424,17 @@ def _try_python_assignment(line: str, session: ShellSession) -> Optional[int]:
             sys.stderr.flush()
             return 1
 
-    # Build an execution local namespace seeded with both env and current py vars
-    # so RHS can reference them.
-    exec_locals: Dict[str, Any] = dict(session.env)
-    exec_locals.update(session.py_vars)
+    # The RHS reads py vars and env through the chain without copying either;
+    # bindings land in the fresh first map.
+    exec_locals = _PythonLocals({}, session.py_vars, session.env)
     try:
-        compiled = compile(tree, '<pysh>', 'exec')
-        exec(compiled, {"__builtins__": __builtins__}, exec_locals)
+        compiled = _compile_cached(line, 'exec')
+        exec(compiled, session.exec_globals, exec_locals)
         # Pull assigned values back into python vars
+        assigned = exec_locals.maps[0]
         for nm in names:
-            if nm in exec_locals:
-                session.set_var(nm, exec_locals[nm])
+            if nm in assigned:
+                session.set_var(nm, assigned[nm])
         return 0
     except Exception as e:
         sys.stderr.write(f"pysh: python error: {e}\n")
@@ -309,11 +449,9 @@ def _pysh_exec_shell_helper(command: str, session: ShellSession) -> int:
         expanded_command = _expand_command_substitutions(command, session, for_python=False)
         
         # Parse and execute as shell command
-        tokens = _tokenize(expanded_command)
-        if not tokens:
+        units = _parse_line(expanded_command)
+        if not units:
             return 0
-        
-        units = _parse_sequence(tokens)
         return _exec_sequence(units, session)
     except Exception as e:
         sys.stderr.write(f"pysh: error executing shell command '{command}': {e}\n")
@@ -321,49 +459,61 @@ def _pysh_exec_shell_helper(command: str, session: ShellSession) -> int:
         return 1
 
 
+def _compile_expression(line: str, expr: ast.expr) -> Any:
+    # Compile the expression's own source text so it can be served from the cache;
+    # fall back to the AST when the segment does not stand alone (e.g. 'x;').
+    segment = ast.get_source_segment(line, expr)
+    if segment is not None:
+        try:
+            return _compile_cached(segment, 'eval')
+        except SyntaxError:
+            pass
+    return compile(ast.Expression(body=expr), '<pysh>', 'eval')
+
+
+class _PythonLocals(collections.ChainMap):
+    """Locals mapping for exec/eval layered over the session variables.
+
+    Like the dict copies it replaces, deleting a name that only exists in a
+    lower layer succeeds without touching the session.
+    """
+
+    def __delitem__(self, key: str) -> None:
+        try:
+            del self.maps[0][key]
+        except KeyError:
+            if key not in self:
+                raise
+
+
 def try_python(line: str, session: ShellSession) -> Optional[int]:
     """Public API: Execute arbitrary Python code, updating session.py_vars.
 
     Returns exit code if executed (0 on success, 1 on error), or None if parsing fails.
     Intended for explicit Python execution (REPL or tests). Command selection logic lives in execute_line.
     """
-    try:
-        tree = ast.parse(line, mode='exec')
-    except SyntaxError:
+    tree = _parse_cached(line, 'exec')
+    if tree is None:
         return None
 
     # Block assigning to preserved command names anywhere in the top-level code
     for node in tree.body:
         if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
             # Collect target names
-            names: List[str] = []
-            def collect(t: ast.AST) -> None:
-                if isinstance(t, ast.Name):
-                    names.append(t.id)
-                elif isinstance(t, (ast.Tuple, ast.List)):
-                    for elt in t.elts:
-                        collect(elt)
-            try:
-                if isinstance(node, ast.Assign):
-                    for t in node.targets:
-                        collect(t)
-                else:
-                    collect(node.target)  # type: ignore[attr-defined]
-            except Exception:
-                pass
-            for nm in names:
-                if nm in GUARANTEED_COMMANDS:
-                    sys.stderr.write(f"pysh: cannot assign to preserved command name: {nm}\n")
-                    sys.stderr.flush()
-                    return 1
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]  # type: ignore[attr-defined]
+            for t in targets:
+                for nm in _target_names(t, strict=False):
+                    if nm in GUARANTEED_COMMANDS:
+                        sys.stderr.write(f"pysh: cannot assign to preserved command name: {nm}\n")
+                        sys.stderr.flush()
+                        return 1
 
     # Handle expression statements (like bare variable names) by evaluating and printing
     if len(tree.body) == 1 and isinstance(tree.body[0], ast.Expr):
         expr = tree.body[0].value
-        eval_locals: Dict[str, Any] = dict(session.env)
-        eval_locals.update(session.py_vars)
+        eval_locals = _PythonLocals({}, session.py_vars, session.env)
         try:
-            val = eval(compile(ast.Expression(body=expr), '<pysh>', 'eval'), {"__builtins__": __builtins__}, eval_locals)
+            val = eval(_compile_expression(line, expr), session.exec_globals, eval_locals)
             # Print the value like REPL; update last value to underscore variable _
             try:
                 session.py_vars['_'] = val
@@ -378,40 +528,15 @@ def try_python(line: str, session: ShellSession) -> Optional[int]:
             sys.stderr.flush()
             return 1
 
-    exec_locals: Dict[str, Any] = dict(session.env)
-    exec_locals.update(session.py_vars)
-    
-    # Add pysh helper functions to the execution context
-    def pysh_exec_shell_dynamic(cmd):
-        """Execute shell command with access to caller's local variables (function parameters)."""
-        import sys
-        # Get the caller's frame (the function calling __pysh_exec_shell)
-        frame = sys._getframe(1)
-        caller_locals = frame.f_locals
-        
-        # Temporarily update session.py_vars with caller's locals (includes function parameters)
-        original_vars = dict(session.py_vars)
-        session.py_vars.update(caller_locals)
-        try:
-            return _pysh_exec_shell_helper(cmd, session)
-        finally:
-            # Restore original py_vars, but keep any new assignments
-            for k, v in session.py_vars.items():
-                if k not in original_vars or original_vars[k] != v:
-                    original_vars[k] = v
-            session.py_vars = original_vars
-    
-    # Create exec_globals with __pysh_exec_shell and session variables
-    # so functions can access both shell execution context and session variables
-    exec_globals = dict(session.py_vars)
-    exec_globals["__builtins__"] = __builtins__
-    exec_globals["__pysh_exec_shell"] = pysh_exec_shell_dynamic
-    
+    # Names bound by the code land in the first map; reads fall through to the
+    # session variables and then the environment without copying either.
+    exec_locals = _PythonLocals({}, session.py_vars, session.env)
+
     try:
-        code = compile(tree, '<pysh>', 'exec')
-        exec(code, exec_globals, exec_locals)
+        code = _compile_cached(line, 'exec')
+        exec(code, session.exec_globals, exec_locals)
         # Sync back names (including imports)
-        for k, v in exec_locals.items():
+        for k, v in exec_locals.maps[0].items():
             if k in ("__builtins__", "__pysh_exec_shell"):
                 continue
             if not k or not (k[0].isalpha() or k[0] == '_'):
@@ -424,6 +549,50 @@ def try_python(line: str, session: ShellSession) -> Optional[int]:
         return 1
 
 
+def _decode_output(data: bytes) -> str:
+    # Like subprocess's text mode (locale encoding, universal newlines), except that
+    # undecodable bytes are replaced, as they already were when echoed
+    text = data.decode(locale.getpreferredencoding(False), errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _echo_output(stream: Any, data: bytes, decoder: codecs.IncrementalDecoder) -> None:
+    # Empty data marks end of output and flushes any partial character held by decoder
+    buffer = getattr(stream, "buffer", None)
+    stream.flush()
+    if buffer is not None:
+        buffer.write(data)
+        buffer.flush()
+    else:
+        # Text-only stream: decode incrementally so characters split across reads survive
+        text = decoder.decode(data, final=not data)
+        if text:
+            stream.write(text)
+        stream.flush()
+
+
+def _pump_output(proc: subprocess.Popen) -> Tuple[bytes, bytes]:
+    """Forward a child's stdout/stderr to ours as it arrives; return all bytes read."""
+    targets = {proc.stdout: sys.stdout, proc.stderr: sys.stderr}
+    received = {proc.stdout: bytearray(), proc.stderr: bytearray()}
+    make_decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))
+    decoders = {pipe: make_decoder(errors="replace") for pipe in targets}
+    with selectors.DefaultSelector() as selector:
+        for pipe in targets:
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = os.read(key.fd, 65536)
+                if not data:
+                    _echo_output(targets[key.fileobj], b"", decoders[key.fileobj])
+                    selector.unregister(key.fileobj)
+                    continue
+                received[key.fileobj] += data
+                _echo_output(targets[key.fileobj], data, decoders[key.fileobj])
+    proc.wait()
+    return bytes(received[proc.stdout]), bytes(received[proc.stderr])
+
+
 class CommandRunner:
     """Wrap execution of a single command string via the system shell.
 
@@ -433,15 +602,21 @@ class CommandRunner:
     - After running, access exit_code, stdout, stderr.
 
     Notes:
-    - shell_run captures stdout/stderr and then echoes them to the parent
-      process's stdout/stderr to approximate shell behavior.
+    - shell_run forwards stdout/stderr to the parent process's streams as the
+      child writes them, and keeps a copy for the stdout/stderr attributes.
+    - With capture=False the child inherits the parent's stdio directly and
+      stdout/stderr stay None; nothing passes through this process.
     - For fully interactive TTY programs, a future method can use a pty.
     """
 
-    def __init__(self, line: str, shell: str, env: Optional[Dict[str, str]] = None) -> None:
+    __slots__ = ('line', 'shell', 'env', 'capture', 'exit_code', 'stdout', 'stderr')
+
+    def __init__(self, line: str, shell: str, env: Optional[Dict[str, str]] = None, capture: bool = True) -> None:
         self.line: str = line
         self.shell: str = shell
-        self.env: Optional[Dict[str, str]] = dict(env) if env is not None else None
+        # Used as given (not copied): it is only read, when the child is spawned
+        self.env: Optional[Dict[str, str]] = env
+        self.capture: bool = capture
         self.exit_code: Optional[int] = None
         self.stdout: Optional[str] = None
         self.stderr: Optional[str] = None
@@ -452,24 +627,31 @@ class CommandRunner:
         Returns the process exit code and stores it on `self.exit_code`.
         """
         try:
-            completed = subprocess.run(
+            if not self.capture:
+                with subprocess.Popen([self.shell, "-c", self.line], env=self.env) as proc:
+                    try:
+                        proc.wait()
+                    except BaseException:
+                        proc.kill()
+                        raise
+                self.exit_code = proc.returncode
+                return self.exit_code
+            with subprocess.Popen(
                 [self.shell, "-c", self.line],
-                capture_output=True,
-                text=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 env=self.env,
-            )
-            self.exit_code = completed.returncode
-            self.stdout = completed.stdout
-            self.stderr = completed.stderr
-
-            # Echo outputs to the terminal to mimic normal shell behavior
-            if self.stdout:
-                sys.stdout.write(self.stdout)
-                sys.stdout.flush()
-            if self.stderr:
-                sys.stderr.write(self.stderr)
-                sys.stderr.flush()
-
+            ) as proc:
+                try:
+                    # Echo outputs to the terminal as they arrive to mimic normal
+                    # shell behavior; the bytes go out as-is, not re-encoded
+                    out, err = _pump_output(proc)
+                except BaseException:
+                    proc.kill()
+                    raise
+            self.exit_code = proc.returncode
+            self.stdout = _decode_output(out)
+            self.stderr = _decode_output(err)
             return self.exit_code
         except KeyboardInterrupt:
             # SIGINT during command
@@ -492,14 +674,20 @@ class CommandRunner:
 # --------- Operator-aware parsing and execution ---------
 
 class Redirection:
-    def __init__(self, fd: int, op: str, target: str | int) -> None:
+    __slots__ = ('fd', 'op', 'target', 'quoting')
+
+    def __init__(self, fd: int, op: str, target: str | int, quoting: str = 'unquoted') -> None:
         # op in { '>', '>>', '<', 'dup' } ; target is filename for >,>>,< and int for dup (e.g., 2>&1)
+        # quoting of a filename target, as for Token
         self.fd = fd
         self.op = op
         self.target = target
+        self.quoting = quoting
 
 
 class SimpleCommand:
+    __slots__ = ('argv', 'redirs')
+
     def __init__(self, argv: List[Tuple[str, str]]) -> None:
         self.argv = argv  # list of (value, quoting)
         self.redirs: List[Redirection] = []
@@ -514,121 +702,98 @@ class ExpandedCommand:
 
 
 class Pipeline:
+    __slots__ = ('commands', 'background')
+
     def __init__(self, commands: List[SimpleCommand], background: bool = False) -> None:
         self.commands = commands
         self.background = background
 
 
 class SequenceUnit:
+    __slots__ = ('pipeline', 'next_op')
+
     def __init__(self, pipeline: Pipeline, next_op: Optional[str]) -> None:
         # next_op in {';', '&&', '||', None}
         self.pipeline = pipeline
         self.next_op = next_op
 
 
-def _tokenize(line: str) -> List[Token]:
+# One alternative per lexical element; every character of a line matches exactly one of them.
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<op>&&|\|\||>>|<<|>&|[|&;<>])
+  | (?P<word>[^\s'"\\|&;<>]+)
+  | '(?P<single>[^']*)'?
+  | "(?P<double>(?:\\.|[^"\\])*\\?)"?
+  | \\(?P<escaped>.?)
+""", re.VERBOSE | re.DOTALL)
+
+# Operator token sets used by the parser. Operator tokens are interned by
+# _tokenize, so membership tests usually resolve on identity.
+_SHELL_OPS = frozenset({'|', '&&', '||', ';', '&', '>', '>>', '<', '>&'})
+_COMMAND_END_OPS = frozenset({'|', '&&', '||', ';', '&'})
+_REDIRECT_OPS = frozenset({'>', '>>', '<', '>&'})
+_SEQUENCE_OPS = frozenset({';', '&&', '||'})
+
+# Backslash escapes inside double quotes; '\$' is kept so expansion can detect it.
+_DQ_ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+
+
+def _dq_unescape(m: re.Match) -> str:
+    ch = m.group(1)
+    return '\\$' if ch == '$' else ch
+
+
+@functools.lru_cache(maxsize=512)
+def _tokenize(line: str) -> Tuple[Token, ...]:
+    # Pure function of the line; cached so has_operators() and the parser share one scan.
+    # Returns a tuple so cached results cannot be mutated by callers.
+    if not line or line.isspace():
+        return ()
     tokens: List[Token] = []
     buf: List[str] = []
-    i = 0
-    n = len(line)
-    in_single = False
-    in_double = False
-    # Track context for current buffer to mark fully quoted tokens
-    buf_seen_single = False
-    buf_seen_double = False
-    buf_seen_unquoted = False
-
-    def flush_buf() -> None:
-        nonlocal buf_seen_single, buf_seen_double, buf_seen_unquoted
-        if buf:
-            val = ''.join(buf)
-            # Determine quoting
-            quoting = 'unquoted'
-            if buf_seen_single and not buf_seen_double and not buf_seen_unquoted:
-                quoting = 'single'
-                val = '\x00S' + val
-            elif buf_seen_double and not buf_seen_single and not buf_seen_unquoted:
-                quoting = 'double'
-                val = '\x00D' + val
-            tokens.append(Token('WORD', val, quoting))
-            buf.clear()
-            buf_seen_single = buf_seen_double = buf_seen_unquoted = False
-
-    while i < n:
-        ch = line[i]
-        if ch == "'" and not in_double:
-            in_single = not in_single
-            i += 1
+    # Quoting of the current word: None until something is added, then 'single',
+    # 'double' or 'unquoted'; mixing contexts within one word yields 'unquoted'.
+    word_quoting: Optional[str] = None
+
+    for m in _TOKEN_RE.finditer(line):
+        kind = m.lastgroup
+        if kind == 'space' or kind == 'op':
+            if buf:
+                tokens.append(Token('WORD', ''.join(buf), word_quoting or 'unquoted'))
+                buf.clear()
+                word_quoting = None
+            if kind == 'op':
+                tokens.append(Token('OP', sys.intern(m.group('op'))))
             continue
-        if ch == '"' and not in_single:
-            in_double = not in_double
-            i += 1
-            continue
-        if ch == '\\' and not in_single:
-            # Escape next character
-            if i + 1 < n:
-                nxt = line[i + 1]
-                # Preserve escape before '$' so expansion can detect it
-                if nxt == '$':
-                    buf.append('\\')
-                    buf.append('$')
-                else:
-                    buf.append(nxt)
-                if in_single:
-                    buf_seen_single = True
-                elif in_double:
-                    buf_seen_double = True
-                else:
-                    buf_seen_unquoted = True
-                i += 2
-                continue
-            else:
-                buf.append('\\')
-                if in_single:
-                    buf_seen_single = True
-                elif in_double:
-                    buf_seen_double = True
-                else:
-                    buf_seen_unquoted = True
-                i += 1
-                continue
-        if not in_single and not in_double:
-            # Whitespace separates arguments
-            if ch.isspace():
-                flush_buf()
-                i += 1
-                continue
-            # Operators
-            if ch in ('|', '&', ';', '<', '>'):
-                flush_buf()
-                # Lookahead for two-char operators
-                if i + 1 < n:
-                    nxt = line[i + 1]
-                    if ch == '&' and nxt == '&':
-                        tokens.append(Token('OP', '&&')); i += 2; continue
-                    if ch == '|' and nxt == '|':
-                        tokens.append(Token('OP', '||')); i += 2; continue
-                    if ch == '>' and nxt == '>':
-                        tokens.append(Token('OP', '>>')); i += 2; continue
-                    if ch == '<' and nxt == '<':
-                        tokens.append(Token('OP', '<<')); i += 2; continue
-                    if ch == '>' and nxt == '&':
-                        tokens.append(Token('OP', '>&')); i += 2; continue
-                tokens.append(Token('OP', ch))
-                i += 1
-                continue
-        # Default: accumulate character
-        buf.append(ch)
-        if in_single:
-            buf_seen_single = True
-        elif in_double:
-            buf_seen_double = True
+
+        if kind == 'word':
+            piece = m.group('word')
+            context = 'unquoted'
+        elif kind == 'single':
+            piece = m.group('single')
+            context = 'single'
+        elif kind == 'double':
+            piece = m.group('double')
+            if '\\' in piece:
+                piece = _DQ_ESCAPE_RE.sub(_dq_unescape, piece)
+            context = 'double'
         else:
-            buf_seen_unquoted = True
-        i += 1
+            # Escape next character; preserve escape before '$' so expansion can detect it
+            nxt = m.group('escaped')
+            piece = '\\$' if nxt == '$' else (nxt or '\\')
+            context = 'unquoted'
 
-    flush_buf()
-    return tokens
+        if piece:
+            buf.append(piece)
+            if word_quoting is None:
+                word_quoting = context
+            elif word_quoting != context:
+                word_quoting = 'unquoted'
+
+    if buf:
+        tokens.append(Token('WORD', ''.join(buf), word_quoting or 'unquoted'))
+    return tuple(tokens)
 
 
 def _expand_command_substitutions(line: str, session: ShellSession, *, for_python: bool) -> str:
@@ -640,6 +805,9 @@ def _expand_command_substitutions(line: str, session: ShellSession, *, for_pytho
     - When for_python=True, inserts a Python string literal representing the output.
       When for_python=False, inserts the raw text (no further quoting is added).
     """
+    if '$(' not in line:
+        # Nothing to substitute; every other character is copied through unchanged
+        return line
     out: List[str] = []
     i = 0
     n = len(line)
@@ -704,21 +872,29 @@ def _expand_command_substitutions(line: str, session: ShellSession, *, for_pytho
     return ''.join(out)
 
 
+_OP_CHAR_RE = re.compile(r'[|&;<>]')
+
+
+@functools.lru_cache(maxsize=512)
 def has_operators(line: str) -> bool:
+    # Operators need one of these characters; most plain commands can be rejected
+    # without tokenizing.
+    if _OP_CHAR_RE.search(line) is None:
+        return False
     # Quote-aware scan for pipe/and/or/sequence/redirection via typed tokens
     tokens = _tokenize(line)
     for t in tokens:
         if t.kind == 'OP':
-            if t.value in {'|', '&&', '||', ';', '&', '>', '>>', '<', '>&'}:
+            if t.value in _SHELL_OPS:
                 return True
     return False
 
 
-def _parse_redirection(tokens: List[Token], i: int, cmd: SimpleCommand) -> int:
+def _parse_redirection(tokens: Sequence[Token], i: int, cmd: SimpleCommand) -> int:
     # Supports: > file, >> file, < file, [n]> file, [n]>> file, 2>&1
     # tokens[i] is either '>', '>>', '<' or an int fd followed by those
     def is_int_tok(tok: Token) -> bool:
-        return tok.kind == 'WORD' and tok.value.isdigit()
+        return tok.kind == 'WORD' and tok.quoting == 'unquoted' and tok.value.isdigit()
 
     fd: int = 1
     op_tok = tokens[i]
@@ -754,44 +930,21 @@ def _parse_redirection(tokens: List[Token], i: int, cmd: SimpleCommand) -> int:
         if j >= len(tokens):
             raise ValueError("redirection missing target")
         target_tok = tokens[j]
-        cmd.redirs.append(Redirection(fd, op_tok.value, target_tok.value))
+        cmd.redirs.append(Redirection(fd, op_tok.value, target_tok.value, target_tok.quoting))
         return j + 1
 
     raise ValueError(f"unsupported redirection near: {' '.join(t.value for t in tokens[i:j+1])}")
 
 
-def _parse_simple(tokens: List[Token], i: int) -> Tuple[SimpleCommand, int]:
-    argv: List[str] = []
-    while i < len(tokens):
-        t = tokens[i]
-        if t.kind == 'OP' and t.value in ('|', '&&', '||', ';', '&'):
-            break
-        # redirection starts: either operator or leading numeric fd
-        if (t.kind == 'OP' and t.value in ('>', '>>', '<')) or (t.kind == 'WORD' and t.value.isdigit()):
-            i = _parse_redirection(tokens, i, SimpleCommand(argv) if False else None)  # type: ignore
-            # The above line is placeholder to satisfy typing in mypy-like tools; will be replaced below
-        else:
-            argv.append(t.value)
-            i += 1
-        # To actually record redirs on the current command, we need the command object.
-    # Now reconstruct by walking again to attach redirs; simpler: parse in one pass with a command object.
-
-    # Re-parse for real to attach redirs
-    cmd = SimpleCommand(argv=[])
-    i2 = i - len(argv)
-    # We need to re-walk from start position; easier approach: second pass from a saved start pointer
-    # Let's implement properly in a single pass instead of above.
-
-
-def _parse_simple_proper(tokens: List[Token], i: int) -> Tuple[SimpleCommand, int]:
+def _parse_simple(tokens: Sequence[Token], i: int) -> Tuple[SimpleCommand, int]:
     cmd = SimpleCommand(argv=[])
     while i < len(tokens):
         t = tokens[i]
-        if t.kind == 'OP' and t.value in ('|', '&&', '||', ';', '&'):
+        if t.kind == 'OP' and t.value in _COMMAND_END_OPS:
             break
-        if t.kind == 'OP' and t.value in ('>', '>>', '<', '>&'):
+        if t.kind == 'OP' and t.value in _REDIRECT_OPS:
             i = _parse_redirection(tokens, i, cmd)
-        elif t.kind == 'WORD' and t.value.isdigit():
+        elif t.kind == 'WORD' and t.quoting == 'unquoted' and t.value.isdigit():
             # Interpret as fd redirection only for dup syntax (n>&m).
             # Do NOT treat a bare number before '>' as fd (e.g., 'echo 10 > f')
             if i + 1 < len(tokens) and (
@@ -808,15 +961,15 @@ def _parse_simple_proper(tokens: List[Token], i: int) -> Tuple[SimpleCommand, in
     return cmd, i
 
 
-def _parse_pipeline(tokens: List[Token], i: int) -> Tuple[Pipeline, int]:
+def _parse_pipeline(tokens: Sequence[Token], i: int) -> Tuple[Pipeline, int]:
     commands: List[SimpleCommand] = []
-    cmd, i = _parse_simple_proper(tokens, i)
+    cmd, i = _parse_simple(tokens, i)
     if not cmd.argv and not cmd.redirs:
         raise ValueError("empty command")
     commands.append(cmd)
     while i < len(tokens) and tokens[i].kind == 'OP' and tokens[i].value == '|':
         i += 1
-        cmd, i = _parse_simple_proper(tokens, i)
+        cmd, i = _parse_simple(tokens, i)
         if not cmd.argv:
             raise ValueError("missing command after '|'")
         commands.append(cmd)
@@ -829,27 +982,34 @@ def _parse_pipeline(tokens: List[Token], i: int) -> Tuple[Pipeline, int]:
     return Pipeline(commands, background), i
 
 
-def _parse_sequence(tokens: List[Token]) -> List[SequenceUnit]:
+def _parse_sequence(tokens: Sequence[Token]) -> List[SequenceUnit]:
     i = 0
     units: List[SequenceUnit] = []
     while i < len(tokens):
         pipeline, i = _parse_pipeline(tokens, i)
         next_op: Optional[str] = None
-        if i < len(tokens) and tokens[i].kind == 'OP' and tokens[i].value in (';', '&&', '||'):
+        if i < len(tokens) and tokens[i].kind == 'OP' and tokens[i].value in _SEQUENCE_OPS:
             next_op = tokens[i].value
             i += 1
         units.append(SequenceUnit(pipeline, next_op))
     return units
 
 
-def _apply_redirections(cmd: SimpleCommand) -> Tuple[Optional[int], Optional[int], Optional[int], List]:
+@functools.lru_cache(maxsize=512)
+def _parse_line(line: str) -> Tuple[SequenceUnit, ...]:
+    # Tokenize and parse in one cached step so re-run lines skip both.
+    # The units are shared between calls: execution must treat them as read-only.
+    return tuple(_parse_sequence(_tokenize(line)))
+
+
+def _apply_redirections(redirs: Sequence[Redirection]) -> Tuple[Optional[int], Optional[int], Optional[int], List]:
     # Returns (stdin_fd, stdout_fd, stderr_fd, closer_list)
     stdin_fd = None
     stdout_fd = None
     stderr_fd = None
     closers: List = []
 
-    for r in cmd.redirs:
+    for r in redirs:
         if r.op == '<':
             f = open(r.target, 'rb')
             closers.append(f)
@@ -883,10 +1043,10 @@ def _apply_redirections(cmd: SimpleCommand) -> Tuple[Optional[int], Optional[int
 def _reconstruct_python_source(argv_tokens: List[Tuple[str, str]]) -> str:
     parts: List[str] = []
     for value, quoting in argv_tokens:
-        if value.startswith("\x00S"):
-            parts.append("'" + value[2:] + "'")
-        elif value.startswith("\x00D"):
-            parts.append('"' + value[2:] + '"')
+        if quoting == 'single':
+            parts.append("'" + value + "'")
+        elif quoting == 'double':
+            parts.append('"' + value + '"')
         else:
             parts.append(value)
     return ' '.join(parts)
@@ -898,16 +1058,12 @@ def _should_treat_as_python(shell_argv: List[str], python_code: str, session: Sh
     cmd_name = shell_argv[0]
     if cmd_name == 'cd' or cmd_name in GUARANTEED_COMMANDS:
         return False
-    env_path = session.get_env().get('PATH', os.defpath)
-    if shutil.which(cmd_name, mode=os.F_OK | os.X_OK, path=env_path):
+    env_path = session.get_env_value('PATH', os.defpath)
+    if _which(cmd_name, session, env_path):
         return False
     if not python_code.strip():
         return False
-    try:
-        ast.parse(python_code, mode='exec')
-        return True
-    except SyntaxError:
-        return False
+    return _parse_cached(python_code, 'exec') is not None
 
 
 def _expand_command_for_stage(cmd: SimpleCommand, session: ShellSession) -> ExpandedCommand:
@@ -916,7 +1072,7 @@ def _expand_command_for_stage(cmd: SimpleCommand, session: ShellSession) -> Expa
     for r in cmd.redirs:
         target = r.target
         if isinstance(target, str):
-            target = _expand_word(target, 'unquoted', session)
+            target = _expand_word(target, r.quoting, session)
         redirs.append(Redirection(r.fd, r.op, target))
     python_source_raw = _reconstruct_python_source(cmd.argv).strip()
     python_code = _expand_command_substitutions(python_source_raw, session, for_python=True) if python_source_raw else ""
@@ -1034,6 +1190,110 @@ def _run_python_stage(cmd: ExpandedCommand, session: ShellSession, input_data: O
     return rc, output_bytes
 
 
+_GREP_ENGINE_FLAGS = frozenset({
+    '-E', '--extended-regexp', '-F', '--fixed-strings', '-G', '--basic-regexp', '-P', '--perl-regexp',
+})
+
+
+_FD_DIR = '/proc/self/fd' if os.path.isdir('/proc/self/fd') else '/dev/fd'
+
+
+def _which(name: str, session: ShellSession, path: Optional[str] = None) -> Optional[str]:
+    """shutil.which for *name* on *path*, remembering hits on the session.
+
+    *path* defaults to the session's PATH.
+
+    Only successful lookups are cached (per PATH value), so a command installed
+    later is still found. A cached hit is re-checked with one access() call
+    and searched for again if it is no longer executable, so a removed command
+    routes exactly as one that was never found.
+    """
+    if path is None:
+        path = session.get_env_value('PATH', os.defpath)
+    if os.sep in name:
+        # Explicit paths are a single access check; nothing to search
+        return shutil.which(name, path=path)
+    key = (name, path)
+    found = session.command_paths.get(key)
+    if found is not None and not os.access(found, os.X_OK):
+        del session.command_paths[key]
+        found = None
+    if found is None:
+        found = shutil.which(name, path=path)
+        if found is not None:
+            session.command_paths[key] = found
+    return found
+
+
+def _resolve_executable(name: str, session: ShellSession, path: str) -> Optional[str]:
+    """Resolve *name* to a path through the session's command path cache.
+
+    The child then execs the path directly instead of walking PATH itself.
+    Returns None when the lookup fails so Popen raises its usual
+    FileNotFoundError.
+    """
+    if os.sep in name:
+        return name
+    return _which(name, session, path)
+
+
+def _inheritable_fds_open() -> bool:
+    """True if a descriptor above stderr would be inherited by a child.
+
+    Descriptors Python opens are non-inheritable, so this is normally False and
+    Popen can skip closing fds, which lets it start the child via posix_spawn.
+    Anything pysh inherited from its parent or that session code marked
+    inheritable forces the close_fds (fork) path so it cannot leak.
+    """
+    try:
+        names = os.listdir(_FD_DIR)
+    except OSError:
+        return True
+    for name in names:
+        fd = int(name)
+        if fd <= 2:
+            continue
+        try:
+            if os.get_inheritable(fd):
+                return True
+        except OSError:
+            # The listing's own descriptor, already closed
+            continue
+    return False
+
+
+def _spawn_stage(argv: List[str], session: ShellSession, path: str, popen_kwargs: Dict[str, Any]) -> Tuple[Optional[subprocess.Popen], int]:
+    """Start one pipeline stage; return (proc, 0), or (None, status) on failure.
+
+    A command whose executable does not exist is reported as not found (127);
+    one that exists but cannot be run, e.g. without execute permission or with
+    a missing #! interpreter, as 126.
+    """
+    name = argv[0]
+    executable = _resolve_executable(name, session, path)
+    try:
+        return subprocess.Popen(argv, executable=executable, **popen_kwargs), 0
+    except OSError as e:
+        err = e
+    if isinstance(err, FileNotFoundError) and executable is not None and os.sep not in name:
+        # Removed after the lookup; forget it and search PATH again
+        session.command_paths.pop((name, path), None)
+        executable = _which(name, session, path)
+        if executable is not None:
+            try:
+                return subprocess.Popen(argv, executable=executable, **popen_kwargs), 0
+            except OSError as e:
+                err = e
+    if isinstance(err, FileNotFoundError) and (executable is None or not os.path.exists(executable)):
+        sys.stderr.write(f"pysh: command not found: {name}\n")
+        code = 127
+    else:
+        sys.stderr.write(f"pysh: {name}: cannot execute: {err.strerror}\n")
+        code = 126
+    sys.stderr.flush()
+    return None, code
+
+
 def _run_shell_group(group: List[ExpandedCommand], session: ShellSession, *, background: bool, initial_input: Optional[bytes], capture_output: bool) -> Tuple[int, Optional[bytes], List[subprocess.Popen]]:
     if not group:
         return 0, initial_input, []
@@ -1044,7 +1304,7 @@ def _run_shell_group(group: List[ExpandedCommand], session: ShellSession, *, bac
     if len(group) == 1 and group[0].argv and group[0].argv[0] == 'cd' and not capture_output and initial_input is None and not background:
         target = None
         if len(group[0].argv) == 1:
-            target = session.get_env().get('HOME') or os.path.expanduser('~')
+            target = session.get_env_value('HOME') or os.path.expanduser('~')
         else:
             target = group[0].argv[1]
         try:
@@ -1061,22 +1321,25 @@ def _run_shell_group(group: List[ExpandedCommand], session: ShellSession, *, bac
     procs: List[subprocess.Popen] = []
     open_handles: List[Any] = []
     prev_stdout = None
+    # Nothing in the group can change variables, so one merged env serves every stage
+    env = session.get_env()
+    path = env.get('PATH', os.defpath)
+    close_fds = _inheritable_fds_open()
+    PIPE = subprocess.PIPE
+    last_idx = len(group) - 1
     try:
         for idx, info in enumerate(group):
-            cmd_stub = SimpleCommand(argv=[])
-            cmd_stub.redirs = [Redirection(r.fd, r.op, r.target) for r in info.redirs]
-            stdin_fd, stdout_fd, stderr_fd, closers = _apply_redirections(cmd_stub)
+            # Redirections are only read, so the expanded command's list is used as-is
+            stdin_fd, stdout_fd, stderr_fd, closers = _apply_redirections(info.redirs)
             open_handles.extend(closers)
 
             if not info.argv:
                 raise ValueError("empty command in pipeline")
 
-            local_argv = list(info.argv)
-            prog_name = os.path.basename(local_argv[0]) if local_argv else ''
-            if prog_name == 'grep':
-                engine_flags = {'-E', '--extended-regexp', '-F', '--fixed-strings', '-G', '--basic-regexp', '-P', '--perl-regexp'}
-                if not any(a in engine_flags for a in local_argv[1:]):
-                    local_argv.insert(1, '-P')
+            local_argv = info.argv
+            # grep defaults to Perl regexes unless an engine was chosen explicitly
+            if local_argv[0].endswith('grep') and os.path.basename(local_argv[0]) == 'grep' and _GREP_ENGINE_FLAGS.isdisjoint(local_argv[1:]):
+                local_argv = [local_argv[0], '-P', *local_argv[1:]]
 
             use_initial_input = idx == 0 and initial_input is not None
             if use_initial_input and stdin_fd is not None:
@@ -1085,27 +1348,47 @@ def _run_shell_group(group: List[ExpandedCommand], session: ShellSession, *, bac
                 return 1, None, []
 
             if use_initial_input:
-                stdin = subprocess.PIPE
+                stdin = PIPE
             else:
                 stdin = prev_stdout if prev_stdout is not None else (stdin_fd if stdin_fd is not None else None)
 
-            if idx < len(group) - 1:
-                stdout = subprocess.PIPE
+            if idx < last_idx:
+                stdout = PIPE
             else:
                 if capture_output:
                     if stdout_fd is not None:
                         sys.stderr.write("pysh: cannot redirect stdout when piping to python stage\n")
                         sys.stderr.flush()
                         return 1, None, []
-                    stdout = subprocess.PIPE
+                    stdout = PIPE
                 else:
                     stdout = stdout_fd if stdout_fd is not None else None
 
             stderr = stderr_fd if stderr_fd is not None else None
 
-            proc = subprocess.Popen(local_argv, stdin=stdin, stdout=stdout, stderr=stderr, env=session.get_env())
+            popen_kwargs = dict(stdin=stdin, stdout=stdout, stderr=stderr, env=env, close_fds=close_fds)
+            proc, code = _spawn_stage(local_argv, session, path, popen_kwargs)
+            if proc is None:
+                # Earlier stages see EOF/SIGPIPE once their pipes are closed; reap them
+                for p in procs:
+                    if p.stdout is not None:
+                        p.stdout.close()
+                        p.stdout = None
+                    p.wait()
+                return code, None, []
             procs.append(proc)
 
+            # The child has its own copies of any redirection targets
+            for h in open_handles:
+                h.close()
+            open_handles.clear()
+
+            if stdin is prev_stdout and prev_stdout is not None:
+                # The child owns the read end now; dropping the parent's copy
+                # lets the upstream stage see SIGPIPE once this stage exits.
+                prev_stdout.close()
+                procs[-2].stdout = None
+
             if use_initial_input:
                 assert proc.stdin is not None
                 proc.stdin.write(initial_input)
@@ -1214,23 +1497,17 @@ def _exec_pipeline(p: Pipeline, session: ShellSession) -> int:
     return last_exit
 
 
-def _exec_sequence(units: List[SequenceUnit], session: ShellSession) -> int:
+def _exec_sequence(units: Sequence[SequenceUnit], session: ShellSession) -> int:
     last = 0
-    i = 0
-    while i < len(units):
-        u = units[i]
+    skip_next = False
+    for u in units:
+        if skip_next:
+            skip_next = False
+            continue
         ec = _exec_pipeline(u.pipeline, session)
         last = ec
         # Decide whether to execute the next unit depending on the operator attached to this one
-        if u.next_op == '&&' and ec != 0:
-            # Skip the next unit
-            i += 2
-            continue
-        if u.next_op == '||' and ec == 0:
-            # Skip the next unit
-            i += 2
-            continue
-        i += 1
+        skip_next = (u.next_op == '&&' and ec != 0) or (u.next_op == '||' and ec == 0)
     return last
 
 
@@ -1240,14 +1517,18 @@ def _execute_hybrid_multiline_buffer(session: ShellSession) -> int:
     This function processes each line in the multi-line buffer to determine if it should
     be executed as Python or shell, even within Python control structures.
     """
-    if not session.multi_line_buffer:
+    return _execute_hybrid_lines(session.multi_line_buffer, session)
+
+
+def _execute_hybrid_lines(lines: Sequence[str], session: ShellSession) -> int:
+    if not lines:
         return 0
     
     # Convert the buffer into executable Python code where shell commands
     # are wrapped in subprocess calls
     converted_lines = []
     
-    for line in session.multi_line_buffer:
+    for line in lines:
         converted_line = _convert_line_for_hybrid_execution(line, session)
         converted_lines.append(converted_line)
     
@@ -1313,7 +1594,7 @@ def _should_execute_as_shell(line: str, session: ShellSession) -> bool:
         return True
     
     # Check if it's available in PATH
-    if shutil.which(first_token):
+    if _which(first_token, session):
         return True
     
     # Check for shell operators
@@ -1325,15 +1606,18 @@ def _should_execute_as_shell(line: str, session: ShellSession) -> bool:
         return True
     
     # Try to parse as Python - if it fails, it might be shell
-    try:
-        ast.parse(line, mode='eval')
+    if _parse_cached(line, 'eval') is not None:
         return False  # Valid Python expression
-    except SyntaxError:
-        # Could be a shell command or invalid Python
-        # Use heuristics: if first token looks like a command, treat as shell
-        if first_token.isidentifier() and not first_token in ['and', 'or', 'not', 'in', 'is']:
-            return True
-        return False
+    # Could be a shell command or invalid Python
+    # Use heuristics: if first token looks like a command, treat as shell
+    if first_token.isidentifier() and not first_token in ['and', 'or', 'not', 'in', 'is']:
+        return True
+    return False
+
+
+# Characters that need quoting, expansion, operators or Python routing; a line
+# without any of them is a bare command plus literal arguments.
+_NON_PLAIN_RE = re.compile(r"""[$~'"\\`|&;<>=(){}\[\]#]""")
 
 
 def execute_line(line: str, session: ShellSession) -> int:
@@ -1362,11 +1646,18 @@ def execute_line(line: str, session: ShellSession) -> int:
 
     # Check if this line starts a Python compound statement
     stripped = line.strip()
-    try:
-        ast.parse(line, mode='exec')
-        # If it parses successfully, it's a complete statement; proceed to normal execution
-    except SyntaxError:
-        # Check if it looks like the start of a compound statement
+    if not stripped:
+        # Blank line outside a block: nothing to lex, parse or run
+        return 0
+    if not _NON_PLAIN_RE.search(stripped):
+        # Fast path for plain commands ("ls -la"): words need no expansion, so
+        # skip the Python probes, tokenizer and parser when argv[0] is a command.
+        argv = stripped.split()
+        if argv[0] == 'cd' or _which(argv[0], session, session.get_env_value('PATH', os.defpath)):
+            rc, _, _ = _run_shell_group([ExpandedCommand(argv=argv, redirs=[], is_python=False)], session, background=False, initial_input=None, capture_output=False)
+            return rc
+    if _parse_cached(line, 'exec') is None:
+        # Not a complete statement: check if it looks like the start of a compound statement
         if stripped.endswith(':') and stripped.split()[0] in ['for', 'while', 'if', 'def', 'class', 'with', 'try', 'async']:
             # Start multi-line accumulation
             _start_multiline_block(session, line)
@@ -1383,29 +1674,19 @@ def execute_line(line: str, session: ShellSession) -> int:
     # Route selection per spec: prefer shell operators and commands next.
     if has_operators(line_shell):
         # Tokenize without pre-expanding variables to preserve escapes and quoting
-        tokens = _tokenize(line_shell)
-        if not tokens:
+        units = _parse_line(line_shell)
+        if not units:
             return 0
-        units = _parse_sequence(tokens)
         return _exec_sequence(units, session)
 
-    # No operators: check command presence first
-    import shlex as _shlex
-    lex = _shlex.shlex(line_shell, posix=True)
-    lex.whitespace_split = True
-    simple_tokens = list(lex)
-    if simple_tokens:
-        cmd = simple_tokens[0]
-        if cmd == 'cd' or shutil.which(cmd, mode=os.F_OK | os.X_OK, path=session.get_env().get('PATH', os.defpath)):
-            tokens = _tokenize(line_shell)
-            if not tokens:
-                return 0
-            units = _parse_sequence(tokens)
-            return _exec_sequence(units, session)
-
-    # Not a shell command: attempt Python (assignment fast-path first to set vars quietly)
-    # Expand command substitutions for Python context (as string literals)
-    line_py = _expand_command_substitutions(line, session, for_python=True)
+    # No operators: check command presence first, reusing the cached token scan
+    tokens = _tokenize(line_shell)
+    if tokens:
+        cmd = tokens[0].value
+        if cmd == 'cd' or _which(cmd, session, session.get_env_value('PATH', os.defpath)):
+            return _exec_sequence(_parse_line(line_shell), session)
+
+    # Not a shell command: attempt Python with the Python view prepared above
     rc = try_python(line_py, session)
     if rc is None:
         sys.stderr.write(f"pysh: command or python code not found: {line}\n")
@@ -1414,6 +1695,17 @@ def execute_line(line: str, session: ShellSession) -> int:
     return rc
 
 
+def execute_lines(block: str, session: ShellSession) -> int:
+    """Execute a multi-line block of hybrid Python/shell code in one go.
+
+    Runs the block the way a completed multi-line REPL block runs. Lines that
+    look like shell commands are rewritten into __pysh_exec_shell(...) calls,
+    and the result is executed as one Python program with try_python. Lines
+    are not dispatched through execute_line one by one.
+    """
+    return _execute_hybrid_lines(block.splitlines(), session)
+
+
 # Public helper for the REPL to expand variables in simple commands before delegating to the system shell
 def expand_line(line: str, session: ShellSession) -> str:
     return _expand_vars_in_line(line, session)
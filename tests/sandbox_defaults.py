@@ -0,0 +1,18 @@
+"""Sandbox settings shared by the pytest fixtures and the standalone runner."""
+import os
+
+
+# Static part of the sandbox environment, resolved once per test run;
+# only HOME (and PWD) depend on the individual sandbox dir.
+BASE_SANDBOX_ENV = {
+    "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+    "LANG": os.environ.get("LANG", "C"),
+    "LC_ALL": os.environ.get("LC_ALL", "C"),
+    "TERM": os.environ.get("TERM", "dumb"),
+}
+# Carry over SHELL if set to respect the user's default shell
+if "SHELL" in os.environ:
+    BASE_SANDBOX_ENV["SHELL"] = os.environ["SHELL"]
+
+# Shell backing every pysh session and the reference shell runs
+DEFAULT_SHELL = os.environ.get("SHELL", "/bin/sh")
@@ -29,6 +29,7 @@ if str(SRC) not in sys.path:
 from contextlib import redirect_stderr
 
 from ops import ShellSession, execute_line, CommandRunner, try_python  # type: ignore
+from sandbox_defaults import BASE_SANDBOX_ENV, DEFAULT_SHELL
 
 
 # Regular pytest test files (run without -e flag)
@@ -49,22 +50,24 @@ PYTEST_EXTENDED_SUITES = [
 
 
 # --- Color utilities ---
-def _use_color() -> bool:
-    return sys.stdout.isatty() and os.environ.get("NO_COLOR") is None
+# Resolved once at import: tty status and NO_COLOR do not change during a run.
+_USE_COLOR = sys.stdout.isatty() and os.environ.get("NO_COLOR") is None
 
 
-def _c(code: str, text: str) -> str:
-    if not _use_color():
-        return text
-    return f"\033[{code}m{text}\033[0m"
+def _sgr(code: str) -> str:
+    return f"\033[{code}m" if _USE_COLOR else ""
 
 
-def green(s: str) -> str: return _c("32", s)
-def red(s: str) -> str: return _c("31", s)
-def yellow(s: str) -> str: return _c("33", s)
-def cyan(s: str) -> str: return _c("36", s)
-def blue(s: str) -> str: return _c("34", s)
-def bold(s: str) -> str: return _c("1", s)
+_GREEN, _RED, _YELLOW, _CYAN, _BLUE, _BOLD = (_sgr(c) for c in ("32", "31", "33", "36", "34", "1"))
+_RESET = _sgr("0")
+
+
+def green(s: str) -> str: return _GREEN + s + _RESET
+def red(s: str) -> str: return _RED + s + _RESET
+def yellow(s: str) -> str: return _YELLOW + s + _RESET
+def cyan(s: str) -> str: return _CYAN + s + _RESET
+def blue(s: str) -> str: return _BLUE + s + _RESET
+def bold(s: str) -> str: return _BOLD + s + _RESET
 
 
 class SkipTest(Exception):
@@ -72,17 +75,7 @@ class SkipTest(Exception):
 
 
 def sandbox_env(tmp: Path) -> dict:
-    env = {
-        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
-        "HOME": str(tmp),
-        "PWD": str(tmp),
-        "LANG": os.environ.get("LANG", "C"),
-        "LC_ALL": os.environ.get("LC_ALL", "C"),
-        "TERM": os.environ.get("TERM", "dumb"),
-    }
-    if "SHELL" in os.environ:
-        env["SHELL"] = os.environ["SHELL"]
-    return env
+    return {**BASE_SANDBOX_ENV, "HOME": str(tmp), "PWD": str(tmp)}
 
 
 def run_line(line: str, sess: ShellSession) -> int:
@@ -1670,8 +1663,7 @@ def test_compare_pysh_vs_shell_phonebook(sess: ShellSession, tmp: Path):
     env = sandbox_env(tmp)
 
     # --- pysh path (interactive via same session) ---
-    shell = os.environ.get("SHELL", "/bin/sh")
-    sess_py = ShellSession(shell=shell, inherit_env=False)
+    sess_py = ShellSession(shell=DEFAULT_SHELL, inherit_env=False)
     sess_py.env.update(env)
 
     # Task1: cat phonebook
@@ -1689,7 +1681,7 @@ def test_compare_pysh_vs_shell_phonebook(sess: ShellSession, tmp: Path):
 
     # --- system shell path ---
     os.chdir(sh_dir)
-    sh = os.environ.get("SHELL", "/bin/sh")
+    sh = DEFAULT_SHELL
 
     def sh_run(cmd: str) -> None:
         r = subprocess.run([sh, "-c", cmd], cwd=sh_dir, env=env, capture_output=True, text=True)
@@ -1784,12 +1776,13 @@ def main(argv: list[str] | None = None) -> int:
     skipped = []
     passed = 0
     tmp = Path(tempfile.mkdtemp(prefix="pysh-test-"))
+    # Directory fd for cheap per-test resets (fchdir skips path resolution)
+    tmp_fd = os.open(tmp, os.O_RDONLY | os.O_DIRECTORY)
     cwd = Path.cwd()
     try:
-        os.chdir(tmp)
+        os.fchdir(tmp_fd)
         env = sandbox_env(tmp)
-        shell = os.environ.get("SHELL", "/bin/sh")
-        sess = ShellSession(shell=shell, inherit_env=False)
+        sess = ShellSession(shell=DEFAULT_SHELL, inherit_env=False)
         sess.env.update(env)
 
         tests = collect_tests(args.extend)
@@ -1797,7 +1790,7 @@ def main(argv: list[str] | None = None) -> int:
         for t in tests:
             try:
                 # Ensure each test starts at the sandbox root
-                os.chdir(tmp)
+                os.fchdir(tmp_fd)
                 # Keep session PWD synced to current cwd for each test
                 sess.env['PWD'] = str(tmp)
                 sess.py_vars['PWD'] = str(tmp)
@@ -1845,6 +1838,7 @@ def main(argv: list[str] | None = None) -> int:
         return 0 if (failed == 0 and errored == 0) else 1
     finally:
         os.chdir(cwd)
+        os.close(tmp_fd)
         shutil.rmtree(tmp, ignore_errors=True)
 
 
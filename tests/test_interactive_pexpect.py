@@ -166,6 +166,34 @@ class TestInteractiveReadline:
             if child.isalive():
                 child.terminate(force=True)
     
+    def test_prefilled_indent_can_be_backspaced(self):
+        """Test that the prefilled indent is editable, so a nested block can be left"""
+        child = pexpect.spawn('python3', [str(ROOT / 'src' / 'main.py')], timeout=5, cwd=str(ROOT))
+        try:
+            child.expect('pysh> ')
+            child.sendline('for i in range(2):')
+            child.expect(r'\.\.\. ')
+            child.sendline('if i:')
+            child.expect(r'\.\.\. ')
+            child.sendline('print("inner", i)')
+            child.expect(r'\.\.\. ')
+            # Erase one level of the prefilled indent to get back to the loop body
+            child.send('\x7f' * 4)
+            child.sendline('print("outer", i)')
+            child.expect(r'\.\.\. ')
+            child.sendline('')
+            child.expect('outer 0')
+            child.expect('inner 1')
+            child.expect('outer 1')
+            child.expect('pysh> ')
+            child.sendline('exit()')
+            child.expect(pexpect.EOF)
+            child.close()
+            assert child.exitstatus == 0
+        finally:
+            if child.isalive():
+                child.terminate(force=True)
+    
     def test_dedent_with_else(self):
         """Test dedentation with else"""
         child = pexpect.spawn('python3', [str(ROOT / 'src' / 'main.py')], timeout=5, cwd=str(ROOT))
@@ -13,6 +13,7 @@ sys.path.insert(0, str(src_path))
 from ops import (
     ShellSession,
     execute_line,
+    execute_lines,
     has_operators,
     expand_line,
     Token,
@@ -52,6 +53,16 @@ class TestShellSessionMethods:
         env = session.get_env()
         assert env["OVERRIDE"] == "python"
     
+    def test_get_env_value_matches_get_env(self, session):
+        """Test that single lookups agree with the merged env."""
+        session.env["OVERRIDE"] = "env"
+        session.py_vars["OVERRIDE"] = 42
+        session.env["ONLY_ENV"] = "env"
+        env = session.get_env()
+        for name in ("OVERRIDE", "ONLY_ENV", "MISSING"):
+            assert session.get_env_value(name) == env.get(name)
+        assert session.get_env_value("MISSING", "fallback") == "fallback"
+    
     def test_get_indent_unit_default(self, session):
         """Test default indent unit."""
         indent = session.get_indent_unit()
@@ -191,6 +202,14 @@ class TestTokenClass:
         assert "OP" in repr_str
         assert "|" in repr_str
 
+    def test_quoted_words_keep_plain_values(self):
+        """Test that quoting is carried on the token, not in its value."""
+        from ops import _tokenize
+        tokens = _tokenize("""echo 'a $b' "c" 2>&1 > 'out file'""")
+        assert [(t.value, t.quoting) for t in tokens if t.kind == 'WORD'] == [
+            ('echo', 'unquoted'), ('a $b', 'single'), ('c', 'double'), ('2', 'unquoted'), ('1', 'unquoted'), ('out file', 'single'),
+        ]
+
 
 class TestDataClasses:
     """Test data classes like Redirection, SimpleCommand, etc."""
@@ -240,13 +259,43 @@ class TestCommandRunner:
         assert result == 0
         assert "test" in runner.stdout
 
+    def test_command_runner_invalid_output_bytes(self, session, monkeypatch):
+        """Test that undecodable output is replaced, not an error."""
+        import io
+        echoed = io.StringIO()
+        monkeypatch.setattr(sys, "stdout", echoed)
+        runner = CommandRunner("printf '\\377ok'", shell=session.shell, env=session.get_env())
+        assert runner.shell_run() == 0
+        assert runner.stdout == "\ufffdok"
+        assert echoed.getvalue() == runner.stdout
+
+    def test_echo_to_text_stream_keeps_split_characters(self):
+        """Test that a character split across reads is echoed intact."""
+        import codecs
+        import io
+        from ops import _echo_output
+        stream = io.StringIO()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in (b"caf\xc3", b"\xa9 \xff", b"\xe2\x82", b""):
+            _echo_output(stream, chunk, decoder)
+        assert stream.getvalue() == "caf\u00e9 \ufffd\ufffd"
+
+    def test_command_runner_without_capture(self, session, capfd):
+        """Test that capture=False leaves output on the inherited streams."""
+        runner = CommandRunner("echo test; exit 3", shell=session.shell, env=session.get_env(), capture=False)
+        result = runner.shell_run()
+        assert result == 3
+        assert runner.stdout is None
+        assert runner.stderr is None
+        assert capfd.readouterr().out == "test\n"
+
 
 class TestGuaranteedCommands:
     """Test that GUARANTEED_COMMANDS contains expected commands."""
     
     def test_guaranteed_commands_exist(self):
         """Test that guaranteed commands set exists."""
-        assert isinstance(GUARANTEED_COMMANDS, set)
+        assert isinstance(GUARANTEED_COMMANDS, frozenset)
         assert len(GUARANTEED_COMMANDS) > 0
     
     def test_basic_commands_included(self):
@@ -397,6 +446,35 @@ class TestPythonExpression:
         captured = capsys.readouterr()
         assert "hello world" in captured.out
 
+    def test_exec_globals_follow_py_vars(self, session):
+        """Test that every change to py_vars is reflected in the exec globals."""
+        g = session.exec_globals
+        session.py_vars.update(a=1, b=2)
+        session.py_vars.setdefault("c", 3)
+        session.py_vars.pop("a")
+        assert (g["b"], g["c"]) == (2, 3) and "a" not in g
+        session.py_vars["__builtins__"] = None
+        session.py_vars.clear()
+        assert "b" not in g and "c" not in g
+        assert g["__builtins__"] is not None
+        assert run_line("z = len('ab')", session) == 0
+        assert g["z"] == 2
+
+    def test_function_sees_reassigned_global(self, session, capsys):
+        """Test that a session function reads the current value of a global."""
+        assert run_line("x = 1", session) == 0
+        assert run_line("def f(): return x", session) == 0
+        assert run_line("f()", session) == 0
+        assert run_line("x = 2", session) == 0
+        assert run_line("f()", session) == 0
+        session.unset_var("x")
+        session.set_var("y", 3)
+        assert run_line("f()", session) == 1
+        assert run_line("y", session) == 0
+        captured = capsys.readouterr()
+        assert captured.out.splitlines() == ["1", "2", "3"]
+        assert "'x' is not defined" in captured.err
+
 
 class TestErrorHandling:
     """Test error handling in various scenarios."""
@@ -415,5 +493,124 @@ class TestErrorHandling:
         assert code == 0 or code != 0  # Just check it doesn't crash
 
 
+class TestCaching:
+    """Test caching of pure lexing/compilation steps."""
+
+    def test_repeated_python_line_reuses_code(self, session):
+        """Test that re-running a line reuses the compiled code object."""
+        from ops import _compile_cached
+        _compile_cached.cache_clear()
+        assert run_line("counter = 1", session) == 0
+        assert run_line("counter = 1", session) == 0
+        assert _compile_cached.cache_info().hits >= 1
+        assert session.py_vars["counter"] == 1
+
+    def test_tokenize_result_is_shared(self):
+        """Test that identical lines share one token tuple."""
+        from ops import _tokenize
+        assert _tokenize("echo a | wc -l") is _tokenize("echo a | wc -l")
+
+    def test_parsed_line_is_reused(self, session, tmp_path):
+        """Test that re-running a shell line reuses its parsed units."""
+        from ops import _parse_line
+        _parse_line.cache_clear()
+        for _ in range(2):
+            assert run_line("echo hi | tr a-z A-Z >> out.txt", session) == 0
+        assert _parse_line.cache_info().hits >= 1
+        assert (tmp_path / "out.txt").read_text() == "HI\nHI\n"
+
+    def test_stale_command_path_is_refreshed(self, session, tmp_path):
+        """Test that a cached executable path that vanished is looked up again."""
+        key = ("echo", session.get_env()["PATH"])
+        session.command_paths[key] = str(tmp_path / "gone" / "echo")
+        assert run_line("echo hi > out.txt", session) == 0
+        assert (tmp_path / "out.txt").read_text() == "hi\n"
+        assert session.command_paths[key] != str(tmp_path / "gone" / "echo")
+
+    def test_removed_command_routes_like_unknown_name(self, session, tmp_path, capsys):
+        """Test that a command deleted after its first run is no longer a command."""
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        tool = bin_dir / "pysh-test-tool"
+        tool.write_text("#!/bin/sh\necho ran\n")
+        tool.chmod(0o755)
+        session.env["PATH"] = f"{bin_dir}{os.pathsep}{session.env['PATH']}"
+        assert run_line("pysh-test-tool", session) == 0
+        tool.unlink()
+        capsys.readouterr()
+        removed = run_line("pysh-test-tool", session)
+        removed_err = capsys.readouterr().err
+        assert removed == run_line("pysh-other-tool", session)
+        assert "command not found" not in removed_err
+        assert ("pysh-test-tool", session.env["PATH"]) not in session.command_paths
+
+    def test_missing_explicit_path_exits_127(self, session, tmp_path, capsys):
+        """Test that a path to nothing is reported as not found."""
+        assert run_line("./missing > out.txt", session) == 127
+        assert "command not found: ./missing" in capsys.readouterr().err
+
+    def test_non_executable_file_exits_126(self, session, tmp_path, capsys):
+        """Test that a file without execute permission cannot be executed."""
+        tool = tmp_path / "tool"
+        tool.write_text("#!/bin/sh\necho ran\n")
+        tool.chmod(0o644)
+        assert run_line("./tool > out.txt", session) == 126
+        assert "./tool: cannot execute" in capsys.readouterr().err
+
+    def test_missing_interpreter_exits_126(self, session, tmp_path, capsys):
+        """Test that a script whose interpreter is missing is not 'not found'."""
+        tool = tmp_path / "tool"
+        tool.write_text(f"#!{tmp_path}/no-such-interpreter\n")
+        tool.chmod(0o755)
+        assert run_line("./tool > out.txt", session) == 126
+        err = capsys.readouterr().err
+        assert "./tool: cannot execute" in err
+        assert "command not found" not in err
+
+
+class TestExecuteLines:
+    """Test executing a whole hybrid block at once."""
+
+    def test_block_with_function_and_shell_command(self, session, tmp_path):
+        """Test a function whose body runs a shell command."""
+        block = "def test_func():\n    echo 'hello' > output.txt\ntest_func()\n"
+        assert execute_lines(block, session) == 0
+        assert (tmp_path / "output.txt").read_text() == "hello\n"
+
+    def test_block_assignments_persist(self, session):
+        """Test that names bound in the block land in the session."""
+        assert execute_lines("x = 2\ny = x * 3\n", session) == 0
+        assert session.py_vars["y"] == 6
+
+    def test_mixed_shell_and_python_block(self, session, tmp_path):
+        """Test a block interleaving Python statements and shell commands."""
+        block = (
+            "names = ['a', 'b']\n"
+            "for n in names:\n"
+            "    echo $n >> out.txt\n"
+            "ls > listing.txt\n"
+            "count = len(open('out.txt').read().split())\n"
+        )
+        assert execute_lines(block, session) == 0
+        assert (tmp_path / "out.txt").read_text() == "a\nb\n"
+        assert "out.txt" in (tmp_path / "listing.txt").read_text()
+        assert session.py_vars["count"] == 2
+
+    def test_block_finds_commands_on_session_path(self, session, tmp_path):
+        """Test that block lines are routed using the session's PATH."""
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        tool = bin_dir / "pysh-test-tool"
+        tool.write_text("#!/bin/sh\necho ran > ran.txt\n")
+        tool.chmod(0o755)
+        session.env["PATH"] = f"{bin_dir}{os.pathsep}{session.env['PATH']}"
+        assert execute_lines("if True:\n    pysh-test-tool\n", session) == 0
+        assert (tmp_path / "ran.txt").read_text() == "ran\n"
+
+    def test_empty_block(self, session):
+        """Test that an empty block is a no-op."""
+        assert execute_lines("", session) == 0
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
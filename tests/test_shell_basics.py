@@ -96,6 +96,54 @@ def test_background_jobs_do_not_block(session, tmp_path):
     assert session.background_jobs
 
 
+def test_endless_producer_stops_when_consumer_exits(session, tmp_path):
+    # 'yes' only terminates via SIGPIPE, so this hangs if pysh keeps the pipe open
+    code = run_line("yes | head -n 2 > out.txt", session)
+    assert code == 0
+    assert (tmp_path / "out.txt").read_text() == "y\ny\n"
+
+
+def test_inheritable_fd_not_visible_in_child(session, tmp_path):
+    r, w = os.pipe()
+    try:
+        os.set_inheritable(w, True)
+        code = run_line(f"sh -c 'test -e /dev/fd/{w}; echo $? > fd.txt'", session)
+        assert code == 0
+        assert (tmp_path / "fd.txt").read_text().strip() == "1"
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+def test_fds_closed_only_when_one_could_leak(session, tmp_path, monkeypatch):
+    import subprocess
+    import ops
+    seen = []
+    real_popen = subprocess.Popen
+
+    def spy(*args, **kwargs):
+        seen.append(kwargs.get("close_fds"))
+        return real_popen(*args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "Popen", spy)
+    monkeypatch.setattr(ops, "_inheritable_fds_open", lambda: False)
+    assert run_line("true", session) == 0
+    monkeypatch.setattr(ops, "_inheritable_fds_open", lambda: True)
+    assert run_line("true", session) == 0
+    assert seen == [False, True]
+
+
+def test_inheritable_fds_open_detects_marked_fd():
+    import ops
+    r, w = os.pipe()
+    try:
+        os.set_inheritable(w, True)
+        assert ops._inheritable_fds_open()
+    finally:
+        os.close(r)
+        os.close(w)
+
+
 def test_simple_command_runner_capture(session):
     # For a simple command (no operators), CommandRunner captures stdout/stderr
     runner = CommandRunner("printf 'a'", shell=session.shell, env=session.get_env())